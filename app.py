@@ -6,26 +6,33 @@ from flask_wtf.csrf import CSRFProtect, generate_csrf
 import html
 import re
 import time
-import json
+import orjson
 import logging
+import base64
+import hashlib
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from datetime import datetime, timedelta
 import jwt
 import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError
+from cachetools import TTLCache
 
 from config import (
     ALLOWED_ORIGINS, RUN_TIMEOUT, SECRET_KEY, 
-    MAX_FILE_SIZE, MAX_TOTAL_FILES_SIZE, JWT_SECRET, BCRYPT_ROUNDS,
-    MEMORY_LIMIT, ENABLE_DEPLOYMENT_VALIDATION
+    MAX_FILE_SIZE, MAX_TOTAL_FILES_SIZE, JWT_SECRET,
+    MEMORY_LIMIT, ENABLE_DEPLOYMENT_VALIDATION, RATE_LIMIT_STORAGE_URL
 )
 from db import (
     fetch_problem_by_slug, fetch_problems_page, store_submission, 
     get_user_submissions, get_submission_detail, get_user_by_username,
-    get_user_by_id, create_user, update_user_last_login,
-    store_submission_testcase
+    get_user_by_id, create_user, update_user_last_login, update_user_password_hash,
+    store_submission_testcases_bulk
 )
 # Updated import to use local execution
-from executor import execute_code_locally, ExecutionResult, simulate_deployment_validation
+from executor import execute_code_locally, execute_batch_locally, ExecutionResult, simulate_deployment_validation
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = SECRET_KEY
@@ -37,7 +44,10 @@ limiter = Limiter(
     key_func=get_remote_address,
     app=app,
     default_limits=["200 per hour", "50 per minute"],
-    storage_uri="memory://"
+    storage_uri=RATE_LIMIT_STORAGE_URL,
+    # Fixed window keeps one counter per key; moving-window stores a timestamp per hit
+    strategy="fixed-window",
+    in_memory_fallback_enabled=True
 )
 
 @app.route("/health")
@@ -53,31 +63,112 @@ def health():
 
 CORS(app, origins=ALLOWED_ORIGINS, supports_credentials=True)
 
-VALID_LANGUAGES = {"java", "python", "c", "cpp", "javascript", "csharp"}
-VALID_FILENAME_PATTERN = re.compile(r'^[a-zA-Z0-9_.-]+$')
-FORBIDDEN_PATTERNS = [r"\.\.", r"^/", r"^~", r"\.pyc$", r"\.class$", r"\.exe$", r"\.dll$", r"\.so$", r"\.sh$"]
+VALID_LANGUAGES = frozenset({"java", "python", "c", "cpp", "javascript", "csharp"})
+VALID_FILENAME_PATTERN = re.compile(r'[a-zA-Z0-9_.-]+')
+FORBIDDEN_PATTERNS = (r"\.\.", r"^/", r"^~", r"\.pyc$", r"\.class$", r"\.exe$", r"\.dll$", r"\.so$", r"\.sh$")
+_FORBIDDEN_RE = re.compile('|'.join(f'(?:{p})' for p in FORBIDDEN_PATTERNS))
 MAX_INPUT_LENGTH = 10000
 MAX_CODE_LENGTH = 50000
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# argon2id at the OWASP baseline (19 MiB, 2 passes); cheaper per login than bcrypt at 12 rounds
+_password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+# HS256 tokens are assembled by hand: the header never changes and the claims are four scalars
+JWT_SECRET_BYTES = JWT_SECRET.encode()
+TOKEN_LIFETIME = 7 * 24 * 3600
+_JWT_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b'=')
+# BLAKE2 keys are capped at 64 bytes, so derive a fixed-size key from the secret
+_TOKEN_FP_KEY = hashlib.blake2b(JWT_SECRET_BYTES, digest_size=32).digest()
+
+# Validated JWT payloads, keyed so raw tokens are never stored.
+# Entries are short-lived to keep the window for a revoked token small.
+TOKEN_CACHE_TTL = 30
+_token_cache = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_TTL)
+_auth_cache_lock = threading.RLock()
+
+# Recently verified (username, password) pairs so repeated logins skip the bcrypt check.
+# Keys are HMACs of the credentials, so a dump of the cache does not reveal passwords.
+_pw_cache = TTLCache(maxsize=2048, ttl=60)
+_pw_cache_lock = threading.Lock()
+
+# Fire-and-forget DB writes that the HTTP response does not depend on
+_write_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="db-write")
+
 def hash_password(password):
-    try: return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+    try: return _password_hasher.hash(password)
     except Exception as e: logger.error(f"Error hashing password: {e}"); return None
 
 def verify_password(password, hashed):
-    try: return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    try:
+        # Accounts created before the argon2 switch still carry bcrypt hashes
+        if hashed.startswith('$2'): return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+        return _password_hasher.verify(hashed, password)
+    except VerifyMismatchError: return False
     except Exception as e: logger.error(f"Error verifying password: {e}"); return False
 
+def password_needs_rehash(hashed):
+    try: return hashed.startswith('$2') or _password_hasher.check_needs_rehash(hashed)
+    except Exception: return False
+
+def _rehash_password(user_id, password):
+    hashed = hash_password(password)
+    if not hashed: return
+    try: update_user_password_hash(user_id, hashed)
+    except Exception as e: logger.error(f"Error upgrading password hash for user ID {user_id}: {e}")
+
+def _credential_key(username, password):
+    return hmac.new(JWT_SECRET.encode(), username.encode() + b'|' + hashlib.sha256(password.encode()).digest(), 'sha256').digest()
+
+def _elapsed(start_ns):
+    # Seconds with ms resolution from the monotonic clock (wall-clock jumps can't skew it)
+    return (time.monotonic_ns() - start_ns) // 1_000_000 / 1000
+
+def _update_last_login(user_id):
+    try: update_user_last_login(user_id)
+    except Exception as e: logger.error(f"Error updating last login for user ID {user_id}: {e}")
+
+def _persist_submission_testcases(submission_id, rows):
+    try: store_submission_testcases_bulk(submission_id, rows)
+    except Exception as e: logger.error(f"Error storing testcase results for submission {submission_id}: {e}")
+
 def generate_token(user_id, username):
-    payload = { 'user_id': user_id, 'username': username, 'exp': datetime.utcnow() + timedelta(days=7), 'iat': datetime.utcnow() }
-    return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
+    now = int(time.time())
+    payload = orjson.dumps({'user_id': user_id, 'username': username, 'exp': now + TOKEN_LIFETIME, 'iat': now})
+    signing_input = _JWT_HEADER_B64 + b'.' + base64.urlsafe_b64encode(payload).rstrip(b'=')
+    signature = hmac.new(JWT_SECRET_BYTES, signing_input, 'sha256').digest()
+    return (signing_input + b'.' + base64.urlsafe_b64encode(signature).rstrip(b'=')).decode('ascii')
+
+def _tok_fp(token):
+    """Keyed 16-byte fingerprint of a token; the only form in which tokens are kept in memory."""
+    return hashlib.blake2b(token.encode(), digest_size=16, key=_TOKEN_FP_KEY).digest()
+
+def _redact_token(token):
+    return token[:8] + "..."
 
 def verify_token(token):
-    try: return jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+    key = _tok_fp(token)
+    now = time.time()
+    with _auth_cache_lock:
+        cached = _token_cache.get(key)
+    if cached and cached[1] > now: return cached[0]
+    try: payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError): return None
-    except Exception as e: logger.error(f"Token verification error: {e}"); return None
+    except Exception as e: logger.error(f"Token verification error for {_redact_token(token)}: {e}"); return None
+    # Never let a cached entry outlive the token itself
+    expires_at = min(payload.get('exp', now), now + TOKEN_CACHE_TTL)
+    with _auth_cache_lock:
+        _token_cache[key] = (payload, expires_at)
+    return payload
+
+def resolve_user_from_bearer(token):
+    """Return (payload, user) for a bearer token; payload is None when the token is invalid."""
+    payload = verify_token(token)
+    if not payload: return None, None
+    # get_user_by_id is served from the db layer's user cache
+    return payload, get_user_by_id(payload['user_id'])
 
 def login_required(f):
     @wraps(f)
@@ -86,11 +177,10 @@ def login_required(f):
         if not token or not token.startswith('Bearer '):
             return jsonify({"error": "Authentication required"}), 401
         token = token[7:]
-        payload = verify_token(token)
+        try: payload, user = resolve_user_from_bearer(token)
+        except Exception as e: logger.error(f"DB Error resolving user from token: {e}"); return jsonify({"error": "Internal server error"}), 500
         if not payload:
             return jsonify({"error": "Invalid or expired token"}), 401
-        try: user = get_user_by_id(payload['user_id'])
-        except Exception as e: logger.error(f"DB Error for user ID {payload['user_id']}: {e}"); return jsonify({"error": "Internal server error"}), 500
         if not user: return jsonify({"error": "User not found"}), 401
         g.current_user = user
         return f(*args, **kwargs)
@@ -99,15 +189,14 @@ def login_required(f):
 def optional_login(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        g.current_user = None
         token = request.headers.get('Authorization')
-        if token and token.startswith('Bearer '):
-            token = token[7:]
-            payload = verify_token(token)
-            if payload:
-                try: user = get_user_by_id(payload['user_id'])
-                except Exception as e: logger.error(f"DB Error for user ID {payload['user_id']}: {e}"); return jsonify({"error": "Internal server error"}), 500
-                if user: g.current_user = user
+        # Anonymous requests are the common case here: skip token handling entirely
+        if not token or not token.startswith('Bearer '):
+            g.current_user = None
+            return f(*args, **kwargs)
+        try: payload, user = resolve_user_from_bearer(token[7:])
+        except Exception as e: logger.error(f"DB Error resolving user from token: {e}"); return jsonify({"error": "Internal server error"}), 500
+        g.current_user = user or None
         return f(*args, **kwargs)
     return decorated_function
 
@@ -120,13 +209,17 @@ def validate_files(files):
         return False, "Too many files (maximum 10)"
     total_size = 0
     for fname, content in files.items():
-        if not VALID_FILENAME_PATTERN.match(fname):
+        if not VALID_FILENAME_PATTERN.fullmatch(fname):
             logger.warning(f"Validation Error: Invalid filename: {fname}")
             return False, f"Invalid filename: {fname}"
-        for pattern in FORBIDDEN_PATTERNS:
-            if re.search(pattern, fname):
-                return False, f"Forbidden filename pattern: {fname}"
-        content_size = len(content.encode('utf-8'))
+        if _FORBIDDEN_RE.search(fname):
+            return False, f"Forbidden filename pattern: {fname}"
+        # Every character is at least one UTF-8 byte, so an oversized str needs no encoding to reject
+        if len(content) > MAX_FILE_SIZE:
+            logger.warning(f"Validation Error: File {fname} too large ({len(content)} chars)")
+            return False, f"File {fname} too large"
+        # ASCII text is one byte per character; only encode when there is something wider
+        content_size = len(content) if content.isascii() else len(content.encode('utf-8'))
         if content_size > MAX_FILE_SIZE:
             logger.warning(f"Validation Error: File {fname} too large ({content_size})")
             return False, f"File {fname} too large"
@@ -141,6 +234,14 @@ def sanitize_input(text, max_length=MAX_INPUT_LENGTH):
     text = str(text)[:max_length]
     return html.escape(text)
 
+def _json_body():
+    """Parse the request body as a JSON object regardless of Content-Type; {} when absent or invalid."""
+    raw = request.get_data(cache=True)
+    if not raw: return {}
+    try: data = orjson.loads(raw)
+    except orjson.JSONDecodeError: return {}
+    return data if isinstance(data, dict) else {}
+
 def rate_limit_key():
     if hasattr(g, 'current_user') and g.current_user:
         return f"user_{g.current_user['id']}"
@@ -157,7 +258,7 @@ def get_csrf_token():
 @app.route("/api/auth/register", methods=["POST"])
 @limiter.limit("10 per hour")
 def register():
-    data = request.get_json(force=True, silent=True) or {}
+    data = _json_body()
     username = data.get('username', '').strip()
     email = data.get('email', '').strip().lower()
     password = data.get('password', '')
@@ -183,15 +284,23 @@ def register():
 @app.route("/api/auth/login", methods=["POST"])
 @limiter.limit("20 per hour")
 def login():
-    data = request.get_json(force=True, silent=True) or {}
+    data = _json_body()
     username = data.get('username', '').strip()
     password = data.get('password', '')
     
     try:
-        user = get_user_by_username(username)
-        if not user or not verify_password(password, user['password_hash']):
-            return jsonify({"error": "Invalid credentials"}), 401
-        update_user_last_login(user['id'])
+        cache_key = _credential_key(username, password)
+        with _pw_cache_lock:
+            user = _pw_cache.get(cache_key)
+        if user is None:
+            user = get_user_by_username(username)
+            if not user or not verify_password(password, user['password_hash']):
+                return jsonify({"error": "Invalid credentials"}), 401
+            if password_needs_rehash(user['password_hash']):
+                _write_pool.submit(_rehash_password, user['id'], password)
+            with _pw_cache_lock:
+                _pw_cache[cache_key] = user
+        _write_pool.submit(_update_last_login, user['id'])
         token = generate_token(user['id'], user['username'])
         return jsonify({"message": "Login successful", "token": token, "user": {"id": user['id'], "username": user['username'], "email": user['email']}})
     except Exception as e:
@@ -208,7 +317,7 @@ def public_problems():
         difficulty = request.args.get("difficulty")
         search = request.args.get("search", "").strip()
         items, total = fetch_problems_page(page, page_size, difficulty, search)
-        return jsonify({"problems": items, "total": total, "page": page, "page_size": page_size, "total_pages": (total + page_size - 1) // page_size})
+        return jsonify({"problems": items, "total": total, "page": page, "page_size": page_size, "total_pages": -(-total // page_size)})
     except Exception as e:
         logger.error(f"Error fetching problems: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -229,8 +338,8 @@ def public_get_problem(slug):
 @limiter.limit("50 per hour", key_func=rate_limit_key)
 @optional_login
 def public_run_code():
-    start_time = time.time()
-    data = request.get_json(force=True, silent=True) or {}
+    start_ns = time.monotonic_ns()
+    data = _json_body()
     language = data.get("language", "java")
     files = data.get("files") or {}
     problem_slug = data.get("problem_slug")
@@ -259,14 +368,14 @@ def public_run_code():
                 "compiled": result.compiled, 
                 "output": result.output, 
                 "error": result.error, 
-                "execution_time": round(time.time() - start_time, 3),
+                "execution_time": _elapsed(start_ns),
                 "verdict": "IE" if result.error and "Internal Error" in result.error else ("RE" if result.error else "AC")
             })
         
         if problem:
             testcases = problem.get("testcases", [])
             result = _run_tests_for_submission(safe_files, language, testcases, False, problem_time_limit, problem_memory_limit)
-            result["execution_time"] = round(time.time() - start_time, 3)
+            result["execution_time"] = _elapsed(start_ns)
             return jsonify(result)
         
         result = execute_code_locally(safe_files, language, "", problem_time_limit, problem_memory_limit)
@@ -274,7 +383,7 @@ def public_run_code():
             "compiled": result.compiled, 
             "output": result.output, 
             "error": result.error, 
-            "execution_time": round(time.time() - start_time, 3),
+            "execution_time": _elapsed(start_ns),
             "verdict": "IE" if result.error and "Internal Error" in result.error else ("RE" if result.error else "AC")
         })
         
@@ -286,8 +395,8 @@ def public_run_code():
 @limiter.limit("30 per hour", key_func=rate_limit_key)
 @login_required
 def public_submit():
-    start_time = time.time()
-    data = request.get_json(force=True, silent=True) or {}
+    start_ns = time.monotonic_ns()
+    data = _json_body()
     language = data.get("language", "java")
     files = data.get("files") or {}
     problem_slug = data.get("problem_slug")
@@ -316,11 +425,11 @@ def public_submit():
         problem_memory_limit = problem.get('memory_limit', MEMORY_LIMIT)
         
         if not testcases:
-            submission_id = store_submission(g.current_user['id'], problem['id'], json.dumps(safe_files), language, "AC", 0, 0, round(time.time() - start_time, 3))
-            return jsonify({"compiled": True, "passed": 0, "total": 0, "verdict": "AC", "submission_id": submission_id, "execution_time": round(time.time() - start_time, 3)})
+            submission_id = store_submission(g.current_user['id'], problem['id'], orjson.dumps(safe_files).decode(), language, "AC", 0, 0, _elapsed(start_ns))
+            return jsonify({"compiled": True, "passed": 0, "total": 0, "verdict": "AC", "submission_id": submission_id, "execution_time": _elapsed(start_ns)})
 
         result = _run_tests_for_submission_with_storage(safe_files, language, testcases, g.current_user['id'], problem['id'], problem_time_limit, problem_memory_limit)
-        result["execution_time"] = round(time.time() - start_time, 3)
+        result["execution_time"] = _elapsed(start_ns)
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in public_submit: {e}", exc_info=True)
@@ -331,33 +440,33 @@ def _run_tests_for_submission_with_storage(safe_files, language, testcases, user
     passed = 0
     tests = []
     submission_id = None
+    # Serialized once; every store_submission branch below stores the same code
+    code_json = orjson.dumps(safe_files).decode()
     
     if total == 0:
         logger.info(f"Problem {problem_id} submitted with no testcases.")
-        submission_id = store_submission(user_id, problem_id, json.dumps(safe_files), language, "AC", 0, 0, 0.0)
+        submission_id = store_submission(user_id, problem_id, code_json, language, "AC", 0, 0, 0.0)
         return {"compiled": True, "tests": tests, "passed": 0, "total": 0, "verdict": "AC", "submission_id": submission_id}
 
-    # PHASE 1: Compilation (Check only once)
-    compile_result = execute_code_locally(safe_files, language, "", time_limit, memory_limit)
+    # PHASE 1: Compile once and run every testcase against the same build
+    results = execute_batch_locally(safe_files, language, [tc.get("input_text", "") for tc in testcases], time_limit, memory_limit)
+    compile_result = results[0]
     if not compile_result.compiled:
         logger.info(f"Submission failed compilation for problem {problem_id}. Error: {compile_result.error}")
-        submission_id = store_submission(user_id, problem_id, json.dumps(safe_files), language, "CE", 0, total, 0.0, 0, compile_result.error)
+        submission_id = store_submission(user_id, problem_id, code_json, language, "CE", 0, total, 0.0, 0, compile_result.error)
         return {"compiled": False, "compile_error": compile_result.error, "tests": [], "passed": 0, "total": total, "verdict": "CE", "submission_id": submission_id}
 
     overall_error = None
     verdict = "AC"
     total_execution_time = 0.0
     
-    # PHASE 2: Test Execution
-    for tc in testcases:
-        test_start_time = time.time()
+    # PHASE 2: Verdicts
+    for tc, result in zip(testcases, results):
         inp = tc.get("input_text", "")
         expected = tc.get("expected_output", "")
         is_hidden = tc.get("is_hidden", False)
         
-        result = execute_code_locally(safe_files, language, inp, time_limit, memory_limit)
-        test_end_time = time.time()
-        test_run_time = round(test_end_time - test_start_time, 3)
+        test_run_time = round(result.execution_time, 3)
         total_execution_time += test_run_time
         
         test_error = None
@@ -410,10 +519,13 @@ def _run_tests_for_submission_with_storage(safe_files, language, testcases, user
 
     # Store submission result
     if not submission_id:
-        submission_id = store_submission(user_id, problem_id, json.dumps(safe_files), language, verdict, passed, total, round(total_execution_time, 3), 0, overall_error)
+        submission_id = store_submission(user_id, problem_id, code_json, language, verdict, passed, total, round(total_execution_time, 3), 0, overall_error)
     
-    for i, test in enumerate(tests):
-        store_submission_testcase(submission_id, testcases[i]['id'], test['status'], test['execution_time'], 0, test.get('output', ''), test.get('error', ''))
+    # The client only needs the verdict and submission id; per-testcase rows are written in the background
+    _write_pool.submit(_persist_submission_testcases, submission_id, [
+        (tc['id'], test['status'], test['execution_time'], 0, test.get('output', ''), test.get('error', ''))
+        for tc, test in zip(testcases, tests)
+    ])
 
     return {"compiled": True, "tests": tests, "passed": passed, "total": total, "verdict": verdict, "error": overall_error, "submission_id": submission_id}
 
@@ -425,19 +537,18 @@ def _run_tests_for_submission(safe_files, language, testcases, is_submission=Tru
     
     if total == 0: return {"compiled": True, "tests": tests, "passed": 0, "total": 0, "verdict": "AC"}
 
-    compile_result = execute_code_locally(safe_files, language, "", time_limit, memory_limit)
+    results = execute_batch_locally(safe_files, language, [tc.get("input_text", "") for tc in testcases], time_limit, memory_limit)
+    compile_result = results[0]
     if not compile_result.compiled:
         return {"compiled": False, "compile_error": compile_result.error, "tests": [], "passed": 0, "total": total, "verdict": "CE"}
 
     overall_error = None
-    for tc in testcases:
-        test_start_time = time.time()
+    for tc, result in zip(testcases, results):
         inp = tc.get("input_text", "")
         expected = tc.get("expected_output", "")
         is_hidden = tc.get("is_hidden", False)
         
-        result = execute_code_locally(safe_files, language, inp, time_limit, memory_limit)
-        test_run_time = round(time.time() - test_start_time, 3)
+        test_run_time = round(result.execution_time, 3)
         overall_execution_time += test_run_time
         
         test_error = None
@@ -480,7 +591,7 @@ def get_submissions():
         page = max(1, int(request.args.get("page", "1")))
         page_size = min(50, max(1, int(request.args.get("page_size", "20"))))
         submissions, total = get_user_submissions(g.current_user['id'], page, page_size)
-        return jsonify({"submissions": submissions, "total": total, "page": page, "page_size": page_size, "total_pages": (total + page_size - 1) // page_size})
+        return jsonify({"submissions": submissions, "total": total, "page": page, "page_size": page_size, "total_pages": -(-total // page_size)})
     except Exception as e:
         logger.error(f"Error fetching submissions: {e}")
         return jsonify({"error": "Failed to fetch submissions"}), 500
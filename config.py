@@ -9,6 +9,10 @@ DB_USER = os.getenv("DB_USER", "root")
 DB_PASS = os.getenv("DB_PASS", "ETfOxlqXMuPmFbrWAhUCGcvhirJBMJmt")
 DB_NAME = os.getenv("DB_NAME", "railway")
 DB_PORT = int(os.getenv("DB_PORT", 19327))
+# Per-process pool; mysql-connector caps a pool at 32. Keep workers * DB_POOL_SIZE below the server's max_connections.
+DB_POOL_SIZE = min(32, int(os.getenv("DB_POOL_SIZE", str((os.cpu_count() or 4) * 2))))
+# Skips the COM_RESET_CONNECTION round-trip on every release; safe while no code sets session state
+DB_POOL_RESET_SESSION = os.getenv("DB_POOL_RESET_SESSION", "False") == "True"
 
 # Security
 SECRET_KEY = os.getenv("SECRET_KEY", "your_very_strong_secret_key_here_change_in_production")
@@ -22,6 +26,16 @@ ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://loc
 RUN_TIMEOUT = int(os.getenv("RUN_TIMEOUT", "30")) 
 MEMORY_LIMIT = os.getenv("MEMORY_LIMIT", "512m") # Adjusted for container limits
 CPU_QUOTA = int(os.getenv("CPU_QUOTA", "-1"))
+# Web worker processes; gunicorn also reads WEB_CONCURRENCY as its --workers default (see Dockerfile)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Submitted programs running at once in each worker process. The default splits the cores across
+# the workers, so the whole container runs at most one CPU-bound program per core (TLE is wall-clock)
+RUN_CONCURRENCY = int(os.getenv("RUN_CONCURRENCY", "0")) or max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+# Compiled outputs reused for identical C/C++/Java/C# sources, kept in memory (per worker process)
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(128 * 1024 ** 2)))
+
+# Seconds a problem (with its testcases) is served from the in-process cache; edits should call db.invalidate_problem
+PROBLEM_CACHE_TTL = int(os.getenv("PROBLEM_CACHE_TTL", "300"))
 
 # File Upload Limits
 PAGE_SIZE = int(os.getenv("PAGE_SIZE", "20"))
@@ -30,6 +44,7 @@ MAX_TOTAL_FILES_SIZE = int(os.getenv("MAX_TOTAL_FILES_SIZE", "200000"))
 SESSION_TYPE = os.getenv("SESSION_TYPE", "filesystem")
 
 # Rate Limiting
+# Use a shared backend (e.g. redis://host:6379/0) in production so counters are shared across workers
 RATE_LIMIT_STORAGE_URL = os.getenv("RATE_LIMIT_STORAGE_URL", "memory://")
 DEFAULT_RATE_LIMIT = os.getenv("DEFAULT_RATE_LIMIT", "1000 per hour")
 
@@ -1,76 +1,182 @@
 import os
-import json
+import orjson
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector.pooling import MySQLConnectionPool
+from mysql.connector.errors import PoolError
+from cachetools import TTLCache
 
-from config import DB_HOST, DB_USER, DB_PASS, DB_NAME, DB_PORT
+from config import DB_HOST, DB_USER, DB_PASS, DB_NAME, DB_PORT, DB_POOL_SIZE, DB_POOL_RESET_SESSION, PROBLEM_CACHE_TTL
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Problems and their testcases rarely change, so they are served from memory for a short window
+_problem_cache = TTLCache(maxsize=1024, ttl=PROBLEM_CACHE_TTL)
+_problem_cache_lock = threading.RLock()
+
+# COUNT(*) totals for paginated listings; a user's count is also dropped when they submit
+_problem_count_cache = TTLCache(maxsize=512, ttl=30)
+_submission_count_cache = TTLCache(maxsize=4096, ttl=10)
+_count_cache_lock = threading.Lock()
+
+# Active user rows by id and by username; every write to a user drops that user's entries
+USERS_CACHE = TTLCache(maxsize=10_000, ttl=60)
+_users_cache_lock = threading.Lock()
+
+# Created on first use rather than at import, so idle workers never open connections
+_pool = None
+_pool_lock = threading.Lock()
+
+def _connect_args():
+    return dict(host=DB_HOST, user=DB_USER, password=DB_PASS, database=DB_NAME, port=DB_PORT, autocommit=True)
+
+# Composite indexes matching the hot WHERE/ORDER BY clauses (slug and username are already UNIQUE)
+_INDEXES = (
+    ("submissions", "idx_submissions_user_created", "user_id, created_at"),
+    ("testcases", "idx_testcases_problem_order", "problem_id, execution_order"),
+    ("problems", "idx_problems_public_difficulty", "is_public, difficulty"),
+)
+
+def ensure_indexes(conn):
+    """Create any missing index from _INDEXES; failures are logged, never raised."""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT DISTINCT index_name FROM information_schema.statistics WHERE table_schema = DATABASE()")
+        existing = {row[0] for row in cur.fetchall()}
+        for table, name, columns in _INDEXES:
+            if name in existing:
+                continue
+            try:
+                cur.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+                logger.info(f"Created index {name} on {table}")
+            except Error as e:
+                logger.warning(f"Could not create index {name} on {table}: {e}")
+    except Error as e:
+        logger.warning(f"Could not check indexes: {e}")
+    finally:
+        cur.close()
+
+def create_pool(retries=1):
+    """
+    Create the shared connection pool, trying up to `retries` times,
+    and make sure the schema has the indexes the queries below rely on.
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            pool = MySQLConnectionPool(pool_name="shyam_pool", pool_size=DB_POOL_SIZE, pool_reset_session=DB_POOL_RESET_SESSION, **_connect_args())
+            break
+        except Error as e:
+            logger.error(f"Error creating connection pool (attempt {attempt}/{retries}): {e}")
+            if attempt == retries:
+                raise
+    conn = pool.get_connection()
+    try:
+        ensure_indexes(conn)
+    finally:
+        conn.close()
+    return pool
+
 def get_conn():
     """
-    Return a new direct connection to the MySQL database.
+    Return a connection from the pool; close() hands it back.
+    Falls back to a direct connection when every pooled connection is in use.
     """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = create_pool(retries=1)
     try:
-        connection = mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASS,
-            database=DB_NAME,
-            port=DB_PORT,
-            autocommit=True
-        )
-        return connection
+        return _pool.get_connection()
+    except PoolError:
+        logger.debug("Connection pool exhausted, opening a direct connection")
+    try:
+        return mysql.connector.connect(**_connect_args())
     except Error as e:
         logger.error(f"Error connecting to database: {e}")
         raise
 
-def get_user_by_username(username):
+@contextmanager
+def cursor(dictionary=False, transaction=False):
+    """
+    Yield a cursor on a pooled connection and release both on exit.
+    With transaction=True the statements are committed together, or rolled back on error.
+    """
     conn = get_conn()
-    cur = conn.cursor(dictionary=True)
+    cur = conn.cursor(dictionary=dictionary)
     try:
-        cur.execute("SELECT id, username, email, password_hash FROM users WHERE username = %s AND is_active = TRUE", (username,))
-        return cur.fetchone()
+        if transaction:
+            conn.start_transaction()
+        yield cur
+        if transaction:
+            conn.commit()
+    except BaseException:
+        if transaction:
+            conn.rollback()
+        raise
     finally:
         cur.close()
         conn.close()
 
+def invalidate_user(user_id=None, username=None):
+    with _users_cache_lock:
+        USERS_CACHE.pop(('id', user_id), None)
+        # Rows by username carry the password hash, so they are tracked separately from rows by id
+        username = USERS_CACHE.pop(('username_of', user_id), None) or username
+        if username is not None:
+            USERS_CACHE.pop(('username', username), None)
+
+def get_user_by_username(username):
+    with _users_cache_lock:
+        user = USERS_CACHE.get(('username', username))
+    if user is not None:
+        return user
+    with cursor(dictionary=True) as cur:
+        cur.execute("SELECT id, username, email, password_hash FROM users WHERE username = %s AND is_active = TRUE", (username,))
+        user = cur.fetchone()
+    if user:
+        with _users_cache_lock:
+            USERS_CACHE[('username', username)] = user
+            USERS_CACHE[('username_of', user['id'])] = username
+    return user
+
 def get_user_by_id(user_id):
-    conn = get_conn()
-    cur = conn.cursor(dictionary=True)
-    try:
+    with _users_cache_lock:
+        user = USERS_CACHE.get(('id', user_id))
+    if user is not None:
+        return user
+    with cursor(dictionary=True) as cur:
         cur.execute("SELECT id, username, email FROM users WHERE id = %s AND is_active = TRUE", (user_id,))
-        return cur.fetchone()
-    finally:
-        cur.close()
-        conn.close()
+        user = cur.fetchone()
+    if user:
+        with _users_cache_lock:
+            USERS_CACHE[('id', user_id)] = user
+    return user
 
 def create_user(username, email, password_hash):
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
+    with cursor() as cur:
         cur.execute("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)", (username, email, password_hash))
-        return cur.lastrowid
-    finally:
-        cur.close()
-        conn.close()
+        user_id = cur.lastrowid
+    invalidate_user(user_id, username)
+    return user_id
 
 def update_user_last_login(user_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
+    with cursor() as cur:
         cur.execute("UPDATE users SET last_login = %s WHERE id = %s", (datetime.utcnow(), user_id))
-    finally:
-        cur.close()
-        conn.close()
+    invalidate_user(user_id)
 
-def fetch_problem_by_slug(slug):
-    conn = get_conn()
-    cur = conn.cursor(dictionary=True)
-    try:
+def update_user_password_hash(user_id, password_hash):
+    with cursor() as cur:
+        cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hash, user_id))
+    invalidate_user(user_id)
+
+def _fetch_problem_by_slug(slug):
+    with cursor(dictionary=True) as cur:
         cur.execute("SELECT id, title, statement, slug, description, difficulty, image_url, template_java, template_python, template_c, template_cpp, template_javascript, template_csharp, examples, constraints, time_limit, memory_limit FROM problems WHERE slug = %s AND is_public = TRUE", (slug,))
         problem = cur.fetchone()
         if problem:
@@ -79,94 +185,135 @@ def fetch_problem_by_slug(slug):
             for field in ['examples', 'constraints']:
                 if problem.get(field):
                     try:
-                        if isinstance(problem[field], str):
-                            problem[field] = json.loads(problem[field])
-                        elif isinstance(problem[field], (bytes, bytearray)):
-                            problem[field] = json.loads(problem[field].decode('utf-8'))
-                    except (json.JSONDecodeError, TypeError):
+                        # orjson takes str and bytes alike, so there is no intermediate decode
+                        if isinstance(problem[field], (str, bytes, bytearray)):
+                            problem[field] = orjson.loads(problem[field])
+                    except (orjson.JSONDecodeError, TypeError):
                         logger.warning(f"Could not decode JSON for problem {problem['id']} field {field}")
                         problem[field] = []
                 else:
                     problem[field] = []
             problem['testcases'] = testcases
         return problem
-    finally:
-        cur.close()
-        conn.close()
 
-def fetch_problems_page(page, page_size, difficulty=None, search=None):
+def fetch_problem_by_slug(slug):
+    with _problem_cache_lock:
+        problem = _problem_cache.get(slug)
+    if problem is not None:
+        return problem
+    problem = _fetch_problem_by_slug(slug)
+    if problem:
+        with _problem_cache_lock:
+            _problem_cache[slug] = problem
+    return problem
+
+def invalidate_problem(slug):
+    """Drop a cached problem; call after editing the problem or its testcases."""
+    with _problem_cache_lock:
+        _problem_cache.pop(slug, None)
+
+def _problems_filter(difficulty=None, search=None):
+    query_base = "FROM problems WHERE is_public = TRUE"
+    params = []
+    if difficulty:
+        query_base += " AND difficulty = %s"
+        params.append(difficulty)
+    if search:
+        query_base += " AND (title LIKE %s OR slug LIKE %s)"
+        search_term = f"%{search}%"
+        params.extend([search_term, search_term])
+    return query_base, params
+
+def fetch_problems_count(difficulty=None, search=None):
+    query_base, params = _problems_filter(difficulty, search)
+    with cursor(dictionary=True) as cur:
+        cur.execute("SELECT COUNT(*) as cnt " + query_base, tuple(params))
+        return cur.fetchone()['cnt']
+
+def _pop_window_total(rows):
+    """Strip the COUNT(*) OVER () column from rows; None when there are no rows to read it from."""
+    total = None
+    for row in rows:
+        total = row.pop('total_count')
+    return total
+
+def fetch_problems_page_items(page, page_size, difficulty=None, search=None, with_total=False):
     offset = (page - 1) * page_size
-    conn = get_conn()
-    cur = conn.cursor(dictionary=True)
-    try:
-        query_base = "FROM problems WHERE is_public = TRUE"
-        params = []
-        if difficulty:
-            query_base += " AND difficulty = %s"
-            params.append(difficulty)
-        if search:
-            query_base += " AND (title LIKE %s OR slug LIKE %s)"
-            search_term = f"%{search}%"
-            params.extend([search_term, search_term])
-
-        count_query = "SELECT COUNT(*) as cnt " + query_base
-        cur.execute(count_query, tuple(params))
-        total = cur.fetchone()['cnt']
-
-        query = "SELECT id, title, slug, difficulty " + query_base + " ORDER BY id LIMIT %s OFFSET %s"
+    query_base, params = _problems_filter(difficulty, search)
+    with cursor(dictionary=True) as cur:
+        # The window count is evaluated over the filtered rows before LIMIT, i.e. the full match count
+        total_column = ", COUNT(*) OVER () AS total_count " if with_total else " "
+        query = "SELECT id, title, slug, difficulty" + total_column + query_base + " ORDER BY id LIMIT %s OFFSET %s"
         params.extend([page_size, offset])
         cur.execute(query, tuple(params))
-        rows = cur.fetchall()
-        return rows, total
-    finally:
-        cur.close()
-        conn.close()
+        return cur.fetchall()
+
+def fetch_problems_page(page, page_size, difficulty=None, search=None):
+    key = (difficulty, search)
+    with _count_cache_lock:
+        total = _problem_count_cache.get(key)
+    if total is not None:
+        return fetch_problems_page_items(page, page_size, difficulty, search), total
+    # Cache miss: read the page and the total in one query
+    rows = fetch_problems_page_items(page, page_size, difficulty, search, with_total=True)
+    total = _pop_window_total(rows)
+    if total is None:
+        # Past the last page there is no row to carry the count
+        total = fetch_problems_count(difficulty, search)
+    with _count_cache_lock:
+        _problem_count_cache[key] = total
+    return rows, total
 
 def store_submission(user_id, problem_id, code, language, verdict, passed, total, execution_time=0.0, memory_used=0, error_message=None):
-    conn = get_conn()
-    cur = conn.cursor()
     try:
-        cur.execute("INSERT INTO submissions (user_id, problem_id, code, language, verdict, passed, total, execution_time, memory_used, error_message) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", (user_id, problem_id, code, language, verdict, passed, total, execution_time, memory_used, error_message))
-        return cur.lastrowid
+        with cursor() as cur:
+            cur.execute("INSERT INTO submissions (user_id, problem_id, code, language, verdict, passed, total, execution_time, memory_used, error_message) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", (user_id, problem_id, code, language, verdict, passed, total, execution_time, memory_used, error_message))
+            submission_id = cur.lastrowid
     except Error as e:
-        conn.rollback()
         logger.error(f"DB Error storing submission: {e}")
         raise
-    finally:
-        cur.close()
-        conn.close()
+    with _count_cache_lock:
+        _submission_count_cache.pop(user_id, None)
+    return submission_id
 
 def store_submission_testcase(submission_id, testcase_id, status, execution_time, memory_used, output, error_message):
-    conn = get_conn()
-    cur = conn.cursor()
+    store_submission_testcases_bulk(submission_id, [(testcase_id, status, execution_time, memory_used, output, error_message)])
+
+def store_submission_testcases_bulk(submission_id, rows):
+    """
+    Store all testcase results of a submission in one round-trip and one transaction.
+    rows: iterable of (testcase_id, status, execution_time, memory_used, output, error_message)
+    """
+    params = [(submission_id,) + tuple(row) for row in rows]
+    if not params:
+        return
     try:
-        cur.execute("INSERT INTO submission_testcases (submission_id, testcase_id, status, execution_time, memory_used, output, error_message) VALUES (%s, %s, %s, %s, %s, %s, %s)", (submission_id, testcase_id, status, execution_time, memory_used, output, error_message))
+        with cursor(transaction=True) as cur:
+            cur.executemany("INSERT INTO submission_testcases (submission_id, testcase_id, status, execution_time, memory_used, output, error_message) VALUES (%s, %s, %s, %s, %s, %s, %s)", params)
     except Error as e:
-        conn.rollback()
-        logger.error(f"DB Error storing submission testcase: {e}")
+        logger.error(f"DB Error storing submission testcases: {e}")
         raise
-    finally:
-        cur.close()
-        conn.close()
 
 def get_user_submissions(user_id, page=1, page_size=20):
     offset = (page - 1) * page_size
-    conn = get_conn()
-    cur = conn.cursor(dictionary=True)
-    try:
-        cur.execute("SELECT s.id, s.problem_id, p.title, p.slug, p.difficulty, s.language, s.verdict, s.passed, s.total, s.execution_time, s.created_at FROM submissions s JOIN problems p ON s.problem_id = p.id WHERE s.user_id = %s ORDER BY s.created_at DESC LIMIT %s OFFSET %s", (user_id, page_size, offset))
+    with cursor(dictionary=True) as cur:
+        with _count_cache_lock:
+            total = _submission_count_cache.get(user_id)
+        total_column = " " if total is not None else ", COUNT(*) OVER () AS total_count "
+        cur.execute("SELECT s.id, s.problem_id, p.title, p.slug, p.difficulty, s.language, s.verdict, s.passed, s.total, s.execution_time, s.created_at" + total_column + "FROM submissions s JOIN problems p ON s.problem_id = p.id WHERE s.user_id = %s ORDER BY s.created_at DESC LIMIT %s OFFSET %s", (user_id, page_size, offset))
         submissions = cur.fetchall()
-        cur.execute("SELECT COUNT(*) as total FROM submissions WHERE user_id = %s", (user_id,))
-        total = cur.fetchone()['total']
+        if total is None:
+            total = _pop_window_total(submissions)
+            if total is None:
+                # Past the last page there is no row to carry the count
+                cur.execute("SELECT COUNT(*) as total FROM submissions WHERE user_id = %s", (user_id,))
+                total = cur.fetchone()['total']
+            with _count_cache_lock:
+                _submission_count_cache[user_id] = total
         return submissions, total
-    finally:
-        cur.close()
-        conn.close()
 
 def get_submission_detail(submission_id, user_id=None):
-    conn = get_conn()
-    cur = conn.cursor(dictionary=True)
-    try:
+    with cursor(dictionary=True) as cur:
         query = "SELECT s.*, p.title, p.slug, u.username FROM submissions s JOIN problems p ON s.problem_id = p.id LEFT JOIN users u ON s.user_id = u.id WHERE s.id = %s"
         params = [submission_id]
         if user_id:
@@ -177,7 +324,4 @@ def get_submission_detail(submission_id, user_id=None):
         if submission:
             cur.execute("SELECT st.*, t.input_text, t.expected_output, t.is_hidden FROM submission_testcases st JOIN testcases t ON st.testcase_id = t.id WHERE st.submission_id = %s ORDER BY st.id", (submission_id,))
             submission['testcases'] = cur.fetchall()
-        return submission
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        return submission
\ No newline at end of file
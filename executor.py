@@ -4,128 +4,590 @@ import tempfile
 import time
 import logging
 import shutil
-from config import RUN_TIMEOUT
+import hashlib
+import threading
+import selectors
+import queue
+import atexit
+import math
+import re
+import resource
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from cachetools import LRUCache
+from config import RUN_TIMEOUT, RUN_CONCURRENCY, ARTIFACT_CACHE_MAX_BYTES
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("executor")
 
+# Program output kept per stream (in characters); anything past it is reported as truncated.
+OUTPUT_LIMIT = 10000
+# Bytes captured per stream: enough for OUTPUT_LIMIT characters of any UTF-8 text, plus one more
+_CAPTURE_BYTES = OUTPUT_LIMIT * 4 + 4
+# Bytes of a program's stderr kept (the tail), shown on runtime errors
+STDERR_TAIL_BYTES = 4096
+# A program that writes more than this in total is killed instead of drained until the time limit
+OUTPUT_HARD_LIMIT = 64 * 1024 * 1024
+
+# Per-run limits besides CPU time and memory: largest file a program may write, open descriptors
+RUN_MAX_FILE_BYTES = 64 * 1024 * 1024
+RUN_MAX_OPEN_FILES = 64
+# Languages whose runtime tolerates RLIMIT_AS at the problem's memory limit
+_ADDRESS_SPACE_LIMITED = frozenset(("python", "c", "cpp"))
+# util-linux prlimit applies rlimits and execs the program, so no Python code runs between fork and exec
+_PRLIMIT = shutil.which("prlimit")
+_PRLIMIT_FLAGS = {
+    resource.RLIMIT_CPU: "--cpu",
+    resource.RLIMIT_FSIZE: "--fsize",
+    resource.RLIMIT_NOFILE: "--nofile",
+    resource.RLIMIT_AS: "--as",
+}
+# A crash with one of these counts as out-of-memory only when the peak RSS reached this
+# fraction of the limit (e.g. dereferencing the NULL a failed malloc returned)
+_CRASH_SIGNALS = frozenset((-signal.SIGSEGV, -signal.SIGABRT, -signal.SIGBUS))
+_MEMORY_NEAR_LIMIT = 0.9
+_MEMORY_LIMIT_RE = re.compile(r'(\d+)\s*([kmg]?)(?:i?b)?', re.IGNORECASE)
+_MEMORY_UNITS = {"": 20, "k": 10, "m": 20, "g": 30}
+
+# Every run of a submitted program goes through this pool, single inputs included, so it is
+# the per-process bound on concurrent programs (RUN_CONCURRENCY, sized across web workers).
+# Submissions are usually CPU-bound and TLE is judged on wall-clock time: oversubscribing
+# the cores would slow every run and cause false TLEs.
+_RUN_WORKERS = RUN_CONCURRENCY
+_run_pool = ThreadPoolExecutor(max_workers=_RUN_WORKERS, thread_name_prefix="exec-run")
+
+@dataclass(slots=True)
 class ExecutionResult:
-    def __init__(self, success=False, output="", error="", compiled=True, execution_time=0.0):
-        self.success = success
-        self.output = output
-        self.error = error
-        self.compiled = compiled
-        self.execution_time = execution_time
+    success: bool = False
+    output: str = ""
+    error: str = ""
+    compiled: bool = True
+    execution_time: float = 0.0
 
-def execute_code_locally(code_files: dict, language: str, stdin_data: str = "", time_limit: int = RUN_TIMEOUT, memory_limit: str = "256m"):
-    # Create a temporary directory
-    temp_dir = tempfile.mkdtemp()
-    
+def _find_scratch_root():
+    """Return /dev/shm when it is a writable tmpfs that allows exec, else None (the default temp dir)."""
+    path = "/dev/shm"
     try:
-        # 1. Determine Main File and Write Code
-        main_file = ""
-        for filename, content in code_files.items():
-            file_path = os.path.join(temp_dir, filename)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            if language == "python" and (filename == "app.py" or filename.endswith(".py")): main_file = filename
-            elif language == "java" and filename == "Main.java": main_file = "Main.java"
-            elif language == "c" and filename == "main.c": main_file = "main.c"
-            elif language == "cpp" and filename == "main.cpp": main_file = "main.cpp"
-            elif language == "javascript" and filename == "index.js": main_file = "index.js"
-            elif language == "csharp" and (filename == "Submission.cs" or filename == "Program.cs"): main_file = filename
-
-        if not main_file and len(code_files) == 1:
-            main_file = list(code_files.keys())[0]
-
-        if not main_file:
-             return ExecutionResult(error="Main file not found or unsupported language configuration.")
-
-        # Define commands
-        commands = {
-            "python": [[f"python3 {main_file}"]],
-            "javascript": [[f"node {main_file}"]],
-            "java": [[f"javac {main_file}"], [f"java -cp . Main"]],
-            "c": [[f"gcc {main_file} -o main"], [f"./main"]],
-            "cpp": [[f"g++ {main_file} -o main"], [f"./main"]],
-            "csharp": [[f"mcs -out:main.exe {main_file}"], [f"mono main.exe"]]
-        }
-
-        if language not in commands:
-            return ExecutionResult(error=f"Unsupported language: {language}")
-
-        cmds = commands[language]
-        
-        start_time = time.time()
-        
-        # Compilation Step (if applicable)
-        if len(cmds) > 1:
-            compile_cmd = cmds[0]
-            try:
-                compile_proc = subprocess.run(
-                    compile_cmd, 
-                    cwd=temp_dir, 
-                    shell=True, 
-                    capture_output=True, 
-                    text=True, 
-                    timeout=15 # Generic timeout for compilation
-                )
-                if compile_proc.returncode != 0:
-                    return ExecutionResult(compiled=False, error=f"Compilation Error:\n{compile_proc.stderr}")
-            except subprocess.TimeoutExpired:
-                return ExecutionResult(compiled=False, error="Compilation Time Limit Exceeded")
-
-            run_cmd = cmds[1]
+        # Container runtimes often mount /dev/shm noexec, which would break running ./main from it
+        if os.path.isdir(path) and os.access(path, os.W_OK | os.X_OK) and not (os.statvfs(path).f_flag & os.ST_NOEXEC):
+            return path
+    except (OSError, AttributeError):
+        pass
+    return None
+
+# RAM-backed working directories keep source writes and compiler output off the disk
+SCRATCH_ROOT = _find_scratch_root()
+
+# Emptied working directories kept for reuse, so a run doesn't pay for mkdtemp + rmtree.
+# Filled lazily per process (safe with forking servers), bounded by the run pool size.
+_workspaces = queue.Queue(maxsize=_RUN_WORKERS * 2)
+
+def _acquire_workspace() -> str:
+    try:
+        return _workspaces.get_nowait()
+    except queue.Empty:
+        return tempfile.mkdtemp(dir=SCRATCH_ROOT, prefix="shyam_ws_")
+
+def _release_workspace(temp_dir: str, reusable: bool = True):
+    """
+    Empty temp_dir and hand it back to the pool; anything odd gets it removed instead.
+    reusable=False (a process of the run may still be alive and writing) always removes it.
+    """
+    if not reusable:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return
+    try:
+        with os.scandir(temp_dir) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+        _workspaces.put_nowait(temp_dir)
+    except (OSError, queue.Full):
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+# Workspace cleanup runs after the results are returned
+_cleanup_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="exec-cleanup")
+
+@atexit.register
+def _drain_workspaces():
+    while True:
+        try:
+            shutil.rmtree(_workspaces.get_nowait(), ignore_errors=True)
+        except queue.Empty:
+            return
+
+# Build outputs of previously compiled sources, keyed by a digest of sources + compile command.
+# Held in this process's memory: submitted programs run as the same uid as the judge, so any
+# on-disk cache they could reach could be rewritten to control later identical submissions.
+# Entries are tuples of (name, mode, bytes), bounded by total size.
+_artifacts = LRUCache(maxsize=ARTIFACT_CACHE_MAX_BYTES, getsizeof=lambda files: sum(len(data) for _, _, data in files) or 1)
+_artifact_lock = threading.Lock()
+
+# Absolute paths of the toolchain binaries, resolved once so each exec skips the PATH walk
+_TOOLCHAINS = {
+    "python": ("python3",),
+    "javascript": ("node",),
+    "java": ("javac", "java"),
+    "c": ("gcc",),
+    "cpp": ("g++",),
+    "csharp": ("mcs", "mono"),
+}
+_BIN = {name: shutil.which(name) for tools in _TOOLCHAINS.values() for name in tools}
+# Languages whose tools are missing are rejected up front instead of failing at exec time
+_UNAVAILABLE = frozenset(lang for lang, tools in _TOOLCHAINS.items() if not all(_BIN[t] for t in tools))
+for _name, _path in _BIN.items():
+    if _path is None:
+        logger.warning(f"'{_name}' not found on PATH; submissions needing it will be rejected")
+_BIN = {name: path or name for name, path in _BIN.items()}
+
+# Entry point per language: file names tried in order, then any file with the suffix (if given)
+_MAIN_FILES = {
+    "python": (("app.py",), ".py"),
+    "java": (("Main.java",), None),
+    "c": (("main.c",), None),
+    "cpp": (("main.cpp",), None),
+    "javascript": (("index.js",), None),
+    "csharp": (("Submission.cs", "Program.cs"), None),
+}
+
+# Cheaper JVM start-up: CDS archive, single-threaded GC, no hsperfdata mmap file.
+# javac additionally stays on C1, which is all a short compile needs.
+_JVM_FLAGS = ("-Xshare:auto", "-XX:+UseSerialGC", "-XX:-UsePerfData")
+
+# Compile (optional) and run argv per language; "{main}" is replaced by the detected main file.
+# Commands are exec'd directly (no shell), so filenames are never shell-interpreted.
+_COMMANDS = {
+    "python": ((_BIN["python3"], "{main}"),),
+    "javascript": ((_BIN["node"], "{main}"),),
+    "java": ((_BIN["javac"], *("-J" + flag for flag in _JVM_FLAGS), "-J-XX:TieredStopAtLevel=1", "{main}"),
+             (_BIN["java"], *_JVM_FLAGS, "-cp", ".", "Main")),
+    # -pipe: compiler stages hand .s/.o over pipes instead of temp files in $TMPDIR (often disk, even with a tmpfs workspace)
+    "c": ((_BIN["gcc"], "-pipe", "{main}", "-o", "main"), ("./main",)),
+    "cpp": ((_BIN["g++"], "-pipe", "{main}", "-o", "main"), ("./main",)),
+    "csharp": ((_BIN["mcs"], "-out:main.exe", "{main}"), (_BIN["mono"], "main.exe")),
+}
+
+def _write_file(path: str, data: bytes, mode: int = 0o600):
+    # Raw fd write: one open, (usually) one write, one close, without the text IO layer
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, mode)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def _prepare_workspace(code_files: dict, language: str, temp_dir: str):
+    """Write the submitted files into temp_dir and return the run/compile commands, or an error result."""
+    # 1. Write Code
+    for filename, content in code_files.items():
+        _write_file(os.path.join(temp_dir, filename), content.encode('utf-8'))
+
+    # 2. Determine Main File: a preferred name, else the first file with the language's suffix, else the only file
+    names, suffix = _MAIN_FILES.get(language, ((), None))
+    main_file = next((name for name in names if name in code_files), None)
+    if not main_file and suffix:
+        main_file = next((name for name in code_files if name.endswith(suffix)), None)
+    if not main_file and len(code_files) == 1:
+        main_file = next(iter(code_files))
+
+    if not main_file:
+         return ExecutionResult(error="Main file not found or unsupported language configuration.")
+
+    templates = _COMMANDS.get(language)
+    if templates is None:
+        return ExecutionResult(error=f"Unsupported language: {language}")
+    if language in _UNAVAILABLE:
+        return ExecutionResult(error=f"Language not available on this server: {language}")
+
+    return [[main_file if arg == "{main}" else arg for arg in argv] for argv in templates]
+
+def _compile(compile_cmd, temp_dir: str):
+    """Run the compile step; returns an ExecutionResult only when compilation fails."""
+    try:
+        compile_proc = subprocess.run(
+            compile_cmd, 
+            cwd=temp_dir, 
+            capture_output=True, 
+            timeout=15 # Generic timeout for compilation
+        )
+        if compile_proc.returncode != 0:
+            # Only the part that is shown gets decoded (template errors can run to megabytes)
+            return ExecutionResult(compiled=False, error=f"Compilation Error:\n{_decode_output(compile_proc.stderr[:_CAPTURE_BYTES])}")
+    except subprocess.TimeoutExpired:
+        return ExecutionResult(compiled=False, error="Compilation Time Limit Exceeded")
+    return None
+
+def _communicate_capped(proc, stdin_data: bytes, deadline: float):
+    """
+    Feed stdin and drain stdout/stderr until the child exits, keeping the first
+    _CAPTURE_BYTES of stdout and the last STDERR_TAIL_BYTES of stderr.
+    Returns (stdout, stderr, stderr_cut, status) where status is None,
+    "timeout" or "overflow".
+    """
+    out_fd, err_fd, stdin_fd = proc.stdout.fileno(), proc.stderr.fileno(), proc.stdin.fileno()
+    out, err = bytearray(), bytearray()
+    err_cut = False
+    drained = 0
+    with selectors.DefaultSelector() as sel:
+        sel.register(out_fd, selectors.EVENT_READ)
+        sel.register(err_fd, selectors.EVENT_READ)
+        if stdin_data:
+            os.set_blocking(stdin_fd, False)
+            sel.register(stdin_fd, selectors.EVENT_WRITE)
         else:
-            run_cmd = cmds[0]
-            
-        # Execution Step
+            proc.stdin.close()
+        offset = 0
+
+        while sel.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None, None, False, "timeout"
+            for key, _ in sel.select(remaining):
+                fd = key.fd
+                if fd == stdin_fd:
+                    try:
+                        offset += os.write(fd, stdin_data[offset:offset + 65536])
+                    except BlockingIOError:
+                        continue
+                    except BrokenPipeError:
+                        offset = len(stdin_data)  # child stopped reading; that's its business
+                    if offset >= len(stdin_data):
+                        sel.unregister(fd)
+                        proc.stdin.close()
+                    continue
+
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    sel.unregister(fd)
+                    continue
+                drained += len(chunk)
+                if fd == err_fd:
+                    # Only the end of stderr matters (the exception line of a traceback)
+                    err += chunk
+                    if len(err) > STDERR_TAIL_BYTES:
+                        del err[:-STDERR_TAIL_BYTES]
+                        err_cut = True
+                else:
+                    room = _CAPTURE_BYTES - len(out)
+                    # Keep draining past the cap so the child never blocks on a full pipe;
+                    # the chunk is only sliced on the one read that crosses the cap
+                    if len(chunk) <= room:
+                        out += chunk
+                    elif room > 0:
+                        out += chunk[:room]
+                if drained > OUTPUT_HARD_LIMIT:
+                    return out, err, err_cut, "overflow"
+
+    return out, err, err_cut, None
+
+def _decode_text(data) -> str:
+    # Same text the old text=True capture produced (universal newlines)
+    text = data.decode('utf-8', errors='replace')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+def _decode_output(data) -> str:
+    # Capture stops at _CAPTURE_BYTES (> OUTPUT_LIMIT characters), so the length test is all
+    # the bookkeeping needed: a stream that was cut always decodes to more than the limit.
+    text = _decode_text(data)
+    if len(text) <= OUTPUT_LIMIT:
+        return text
+    return text[:OUTPUT_LIMIT] + '... [Truncated]'
+
+def _decode_tail(data, cut: bool) -> str:
+    if not cut:
+        return _decode_text(data)
+    # Skip UTF-8 continuation bytes left over from the cut
+    start = 0
+    while start < len(data) and data[start] & 0xC0 == 0x80:
+        start += 1
+    return '[Truncated] ...' + _decode_text(data[start:])
+
+def _parse_memory_limit(value):
+    """'256m' / '1g' / '512MB' / '256' (MiB) -> bytes; None when unset or unparseable."""
+    match = _MEMORY_LIMIT_RE.fullmatch(str(value or "").strip())
+    if not match:
+        if value:
+            logger.warning(f"Ignoring unparseable memory limit {value!r}")
+        return None
+    return int(match.group(1)) << _MEMORY_UNITS[match.group(2).lower()]
+
+def _run_limits(language: str, time_limit, memory_limit):
+    """Kernel-enforced limits for a submitted program, as (resource, value) pairs."""
+    cpu = math.ceil(float(time_limit)) + 1
+    limits = [
+        (resource.RLIMIT_CPU, cpu),
+        (resource.RLIMIT_FSIZE, RUN_MAX_FILE_BYTES),
+        (resource.RLIMIT_NOFILE, RUN_MAX_OPEN_FILES),
+    ]
+    memory = _parse_memory_limit(memory_limit)
+    # The JVM, mono and node reserve far more address space than they use, so a
+    # RLIMIT_AS at the problem's memory limit would stop them from starting at all
+    if memory and language in _ADDRESS_SPACE_LIMITED:
+        limits.append((resource.RLIMIT_AS, memory))
+    return tuple(limits)
+
+def _apply_limits(limits):
+    # Fallback when prlimit is unavailable; runs in the forked child before exec, so no imports, locks or logging
+    def preexec():
+        for res, value in limits:
+            resource.setrlimit(res, (value, value))
+    return preexec
+
+def _limited_argv(run_cmd, limits):
+    """Prefix run_cmd with prlimit, which sets the limits on itself and execs the program."""
+    return [_PRLIMIT, *(f"{_PRLIMIT_FLAGS[res]}={value}" for res, value in limits), "--", *run_cmd]
+
+def _await_exit(pid: int, deadline: float) -> bool:
+    """Block until pid exits or deadline passes, without reaping it; False on timeout."""
+    try:
+        # A pidfd becomes readable when the process exits: one blocking select
+        # instead of a sleep-and-poll loop
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        # WNOWAIT leaves the zombie in place, same as the pidfd path
+        while os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+    try:
+        with selectors.DefaultSelector() as sel:
+            sel.register(pidfd, selectors.EVENT_READ)
+            return bool(sel.select(max(0, deadline - time.monotonic())))
+    finally:
+        os.close(pidfd)
+
+def _wait_exit(proc, deadline: float):
+    """
+    Wait for proc to exit, kill whatever it left running, then reap it.
+    Returns the program's peak RSS in bytes, or None if it is still running at deadline.
+    """
+    if not _await_exit(proc.pid, deadline):
+        return None
+    # The leader is an unreaped zombie here, so its pgid cannot have been reused:
+    # background children it started die with it instead of outliving the run
+    _kill_group(proc)
+    # wait4 rather than proc.wait() to get the program's resource usage along with the status
+    _, wait_status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(wait_status)
+    return usage.ru_maxrss * 1024  # KiB on Linux
+
+def _hit_memory_limit(limits, returncode: int, stderr: str, peak_rss: int) -> bool:
+    """
+    Whether a failed run ran out of its RLIMIT_AS budget. Only on evidence: Python's
+    MemoryError, C++'s std::bad_alloc, or a crash after the program had grown close to the
+    limit; an ordinary segfault or failed assert stays a runtime error.
+    """
+    memory = next((value for res, value in limits if res == resource.RLIMIT_AS), None)
+    if memory is None:
+        return False
+    last_line = stderr.rstrip().rpartition("\n")[2]
+    if last_line.startswith("MemoryError") or "std::bad_alloc" in stderr:
+        return True
+    return returncode in _CRASH_SIGNALS and peak_rss >= memory * _MEMORY_NEAR_LIMIT
+
+def _kill_group(proc):
+    """Kill the program and anything it spawned (it leads its own session)."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _group_gone(pgid: int) -> bool:
+    """True once no process is left in the group; SIGKILL delivery is asynchronous, so allow a moment."""
+    for _ in range(20):
         try:
-            run_proc = subprocess.run(
-                run_cmd,
-                cwd=temp_dir,
-                input=stdin_data,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=time_limit
-            )
-            
-            duration = round(time.time() - start_time, 3)
-            
-            # Truncate output to prevent massive logs
-            stdout_limit = 10000
-            output_truncated = (run_proc.stdout[:stdout_limit] + '... [Truncated]') if len(run_proc.stdout) > stdout_limit else run_proc.stdout
-            stderr_truncated = (run_proc.stderr[:stdout_limit] + '... [Truncated]') if len(run_proc.stderr) > stdout_limit else run_proc.stderr
-
-            if run_proc.returncode != 0:
-                return ExecutionResult(
-                    success=False, 
-                    error=stderr_truncated or "Runtime Error", 
-                    output=output_truncated,
-                    execution_time=duration
-                )
+            os.killpg(pgid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        time.sleep(0.001)
+    return False
+
+def _run(run_cmd, temp_dir: str, stdin_data: str, time_limit: int, limits=()):
+    """
+    Run an already-compiled program against one stdin blob. Returns (result, clean):
+    clean means no process of the run is left, so temp_dir is safe to hand out again.
+    """
+    spawned = []
+    result = _run_program(run_cmd, temp_dir, stdin_data, time_limit, limits, spawned)
+    # Checked after the leader was reaped: its pid stays reserved while the group has members
+    return result, not spawned or _group_gone(spawned[0])
+
+def _run_program(run_cmd, temp_dir: str, stdin_data: str, time_limit: int, limits, spawned: list):
+    start_ns = time.monotonic_ns()
+    try:
+        # Without preexec_fn, Popen can take the vfork path: no copy of this process's page tables
+        argv, preexec = (_limited_argv(run_cmd, limits), None) if _PRLIMIT and limits else (run_cmd, _apply_limits(limits))
+        with subprocess.Popen(
+            argv,
+            cwd=temp_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            preexec_fn=preexec,
+            start_new_session=True
+        ) as run_proc:
+            spawned.append(run_proc.pid)
+            deadline = start_ns / 1e9 + time_limit
+            peak_rss = 0
+            try:
+                stdout, stderr, stderr_cut, status = _communicate_capped(run_proc, stdin_data.encode('utf-8'), deadline)
+                # Pipes are closed but the child may still be running
+                if status is None:
+                    peak_rss = _wait_exit(run_proc, deadline)
+                    if peak_rss is None:
+                        status = "timeout"
+            finally:
+                # Not reaped yet, so the process group id cannot have been reused
+                if run_proc.returncode is None:
+                    _kill_group(run_proc)
+
+        duration = (time.monotonic_ns() - start_ns) // 1_000_000 / 1000
+
+        # RLIMIT_CPU delivers SIGXCPU once the CPU budget is spent
+        if status == "timeout" or run_proc.returncode == -signal.SIGXCPU:
+            return ExecutionResult(success=False, error="Time Limit Exceeded", execution_time=time_limit)
+
+        # Output is captured only up to the limit, so massive logs never reach memory
+        output_truncated = _decode_output(stdout)
+        stderr_truncated = _decode_tail(stderr, stderr_cut)
+
+        if status == "overflow":
+            return ExecutionResult(success=False, error="Output Limit Exceeded", output=output_truncated, execution_time=duration)
+
+        if run_proc.returncode != 0 and _hit_memory_limit(limits, run_proc.returncode, stderr_truncated, peak_rss):
+            return ExecutionResult(success=False, error="Memory Limit Exceeded", output=output_truncated, execution_time=duration)
 
+        if run_proc.returncode != 0:
             return ExecutionResult(
-                success=True, 
-                output=output_truncated, 
+                success=False, 
+                error=stderr_truncated or "Runtime Error", 
+                output=output_truncated,
                 execution_time=duration
             )
 
-        except subprocess.TimeoutExpired:
-            return ExecutionResult(success=False, error="Time Limit Exceeded", execution_time=time_limit)
-        except Exception as e:
-            return ExecutionResult(success=False, error=f"Runtime System Error: {str(e)}")
+        return ExecutionResult(
+            success=True, 
+            output=output_truncated, 
+            execution_time=duration
+        )
+
+    except Exception as e:
+        return ExecutionResult(success=False, error=f"Runtime System Error: {str(e)}")
+
+def _copy_workspace(src: str, dst: str):
+    """Copy the sources and build outputs in src into the empty workspace dst."""
+    with os.scandir(src) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.copytree(entry.path, os.path.join(dst, entry.name), symlinks=True)
+            else:
+                shutil.copy2(entry.path, os.path.join(dst, entry.name), follow_symlinks=False)
+
+def _run_isolated(build_dir: str, run_cmd, stdin_data: str, time_limit: int, limits):
+    """Run one input in a private copy of build_dir, so concurrent runs never see each other's files."""
+    run_dir = _acquire_workspace()
+    clean = True
+    try:
+        _copy_workspace(build_dir, run_dir)
+        result, clean = _run(run_cmd, run_dir, stdin_data, time_limit, limits)
+    except OSError as e:
+        result = ExecutionResult(success=False, error=f"Runtime System Error: {str(e)}")
+    finally:
+        _cleanup_pool.submit(_release_workspace, run_dir, clean)
+    return result
+
+def _source_digest(code_files: dict, compile_cmd) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in compile_cmd:
+        h.update(part.encode() + b"\0")
+    for name in sorted(code_files):
+        data = code_files[name].encode('utf-8')
+        h.update(name.encode() + b"\0" + len(data).to_bytes(8, "little") + data)
+    return h.hexdigest()
+
+def _restore_artifacts(digest: str, temp_dir: str) -> bool:
+    """Write cached build outputs into temp_dir; False on a cache miss."""
+    with _artifact_lock:
+        files = _artifacts.get(digest)
+    if not files:
+        return False
+    try:
+        for name, mode, data in files:
+            _write_file(os.path.join(temp_dir, name), data, mode)
+        return True
+    except OSError:
+        return False
+
+def _store_artifacts(digest: str, temp_dir: str, sources) -> None:
+    """Remember the files the compiler produced in temp_dir; best effort, failures only cost a recompile."""
+    try:
+        outputs = [e for e in os.scandir(temp_dir) if e.name not in sources]
+        # Only flat outputs are cached (e.g. javac with package directories is not)
+        if not outputs or any(not e.is_file(follow_symlinks=False) for e in outputs):
+            return
+        files = []
+        for e in outputs:
+            with open(e.path, 'rb') as f:
+                files.append((e.name, e.stat().st_mode & 0o700, f.read()))
+        with _artifact_lock:
+            _artifacts[digest] = tuple(files)
+    except ValueError:
+        pass  # larger than the whole cache
+    except OSError as e:
+        logger.warning(f"Could not cache build artifacts: {e}")
+
+def execute_batch_locally(code_files: dict, language: str, inputs: list, time_limit: int = RUN_TIMEOUT, memory_limit: str = "256m"):
+    """
+    Compile once and run the program against every stdin blob in inputs.
+    Returns one ExecutionResult per input; if setup or compilation fails, that
+    result is repeated for every input. Each input runs in a fresh directory
+    holding only the sources and build outputs, never files left by another run.
+    """
+    temp_dir = _acquire_workspace()
+    reusable = True
+
+    try:
+        cmds = _prepare_workspace(code_files, language, temp_dir)
+        if isinstance(cmds, ExecutionResult):
+            return [cmds] * len(inputs)
+
+        # Compilation Step (if applicable), skipped when the same sources were built before
+        if len(cmds) > 1:
+            digest = _source_digest(code_files, cmds[0])
+            if not _restore_artifacts(digest, temp_dir):
+                compile_error = _compile(cmds[0], temp_dir)
+                if compile_error:
+                    return [compile_error] * len(inputs)
+                _store_artifacts(digest, temp_dir, code_files)
+
+        # Execution Step (results keep the order of inputs)
+        run_cmd = cmds[-1]
+        limits = _run_limits(language, time_limit, memory_limit)
+        if len(inputs) == 1:
+            # The build directory is still pristine, so a single run can use it directly
+            result, reusable = _run_pool.submit(_run, run_cmd, temp_dir, inputs[0], time_limit, limits).result()
+            return [result]
+        futures = [_run_pool.submit(_run_isolated, temp_dir, run_cmd, stdin_data, time_limit, limits) for stdin_data in inputs]
+        return [future.result() for future in futures]
             
     except Exception as e:
-        return ExecutionResult(success=False, error=f"System Error: {str(e)}")
+        reusable = False
+        return [ExecutionResult(success=False, error=f"System Error: {str(e)}")] * len(inputs)
     finally:
-        # Cleanup temp directory
-        try:
-            shutil.rmtree(temp_dir, ignore_errors=True)
-        except:
-            pass
+        # Empty the temp directory for the next run, off the caller's path
+        _cleanup_pool.submit(_release_workspace, temp_dir, reusable)
+
+def execute_code_locally(code_files: dict, language: str, stdin_data: str = "", time_limit: int = RUN_TIMEOUT, memory_limit: str = "256m"):
+    return execute_batch_locally(code_files, language, [stdin_data], time_limit, memory_limit)[0]
 
 def simulate_deployment_validation(language):
     